@@ -6,17 +6,26 @@ for Stable Diffusion and other diffusion models using the Hugging Face diffusers
 """
 
 import argparse
+import asyncio
 import base64
+import functools
 import io
+import json
 import logging
 import os
+import threading
 import time
-from typing import Optional, List, Literal
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Callable, Iterator, Optional, List, Literal
 
+import numpy as np
 import torch
 from diffusers import DiffusionPipeline, StableDiffusionPipeline, AutoPipelineForText2Image
+from diffusers.image_processor import VaeImageProcessor
 from fastapi import FastAPI, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
+from PIL import Image
 from pydantic import BaseModel, Field
 import uvicorn
 
@@ -30,6 +39,51 @@ app = FastAPI(title="Diffusers Server", description="OpenAI Images API compatibl
 pipeline: Optional[DiffusionPipeline] = None
 current_model: Optional[str] = None
 served_model_name: Optional[str] = None
+low_vram: bool = False
+compile_unet: bool = False
+quantization: Optional[str] = None
+generators: dict[str, List[torch.Generator]] = {}
+model_lock = threading.Lock()
+
+# Maximum number of images generated in a single pipeline call. Larger
+# requests are split into batches of at most this size to bound VRAM usage.
+MAX_BATCH_SIZE = max(1, int(os.environ.get("DIFFUSERS_MAX_BATCH", "4")))
+
+# Encoding used for generated images. The b64_json response field is format
+# agnostic; WebP is much faster to encode and 2-4x smaller than PNG.
+IMAGE_SAVE_OPTIONS = {
+    # Favour encode speed over size: the result is base64 encoded anyway
+    "PNG": {"compress_level": 1},
+    "WEBP": {"quality": 90, "method": 4},
+    "JPEG": {"quality": 92},
+}
+IMAGE_FORMAT = os.environ.get("DIFFUSERS_IMAGE_FORMAT", "WEBP").upper()
+
+# torchvision is optional and only used to encode PNGs. Import it only when
+# needed: a build that doesn't match the installed torch fails at import with
+# a RuntimeError rather than an ImportError.
+encode_png = None
+if IMAGE_FORMAT == "PNG":
+    try:
+        from torchvision.io import encode_png
+    except Exception as e:
+        logger.info(f"torchvision PNG encoding unavailable ({e}), using PIL")
+
+# How long an idle server waits for concurrent requests to join a batch
+BATCH_WINDOW = float(os.environ.get("DIFFUSERS_BATCH_WINDOW_MS", "50")) / 1000
+
+# Queue of pending generation jobs, drained by the batch dispatcher task
+generation_queue: Optional[asyncio.Queue] = None
+dispatcher_task: Optional[asyncio.Task] = None
+
+# Single thread that runs the warmup and every pipeline call. The pipeline is
+# not thread-safe, and torch.compile's CUDA graphs keep thread-local state, so
+# generation must always happen on the same thread.
+generation_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="generate")
+
+# Thread pool used to encode generated images off the request path
+encode_pool = ThreadPoolExecutor(max_workers=min(10, os.cpu_count() or 1), thread_name_prefix="encode")
+encode_buffers = threading.local()
 
 
 class ImageGenerationRequest(BaseModel):
@@ -60,6 +114,7 @@ class ImageGenerationResponse(BaseModel):
     data: List[ImageData]
 
 
+@functools.lru_cache(maxsize=32)
 def parse_size(size: str) -> tuple[int, int]:
     """Parse size string like '512x512' into (width, height) tuple"""
     try:
@@ -99,6 +154,7 @@ def load_model_from_dduf(dduf_path: str, device: str, dtype: torch.dtype) -> Dif
             dduf_dir,
             dduf_file=dduf_filename,
             torch_dtype=dtype,
+            low_cpu_mem_usage=True,
         )
         
         pipe = pipe.to(device)
@@ -110,135 +166,472 @@ def load_model_from_dduf(dduf_path: str, device: str, dtype: torch.dtype) -> Dif
         raise RuntimeError(f"Failed to load DDUF file: {e}")
 
 
+def from_pretrained_with_variant(pipeline_cls, model_path: str, dtype: torch.dtype, **kwargs) -> DiffusionPipeline:
+    """Load a pipeline, preferring the fp16 weight variant when running in float16"""
+    # diffusers already prefers memory mapped safetensors weights when they are
+    # present and falls back to .bin otherwise. low_cpu_mem_usage streams them
+    # into meta-initialized modules instead of materializing randomly
+    # initialized weights first.
+    if dtype == torch.float16:
+        try:
+            return pipeline_cls.from_pretrained(
+                model_path,
+                torch_dtype=dtype,
+                low_cpu_mem_usage=True,
+                variant="fp16",
+                **kwargs,
+            )
+        except (OSError, ValueError) as e:
+            # Not every repository publishes an fp16 variant; the full precision
+            # weights are cast to float16 on load instead. diffusers reports a
+            # missing variant as a ValueError ("no such modeling files") or, for
+            # missing files, an OSError naming the fp16 file. Anything else is a
+            # real load error.
+            if "fp16" not in str(e):
+                raise
+            logger.info(f"No fp16 variant available for {model_path} ({e}), loading default weights")
+    return pipeline_cls.from_pretrained(
+        model_path,
+        torch_dtype=dtype,
+        low_cpu_mem_usage=True,
+        **kwargs,
+    )
+
+
+def quantize_denoiser(pipe: DiffusionPipeline, mode: str):
+    """Quantize the linear layers of the pipeline's UNet/transformer weights with torchao"""
+    try:
+        from torchao.quantization import quantize_, Int8WeightOnlyConfig, Float8WeightOnlyConfig
+    except ImportError:
+        raise RuntimeError("torchao is required for --quantize. Install with: uv pip install torchao")
+    
+    denoiser = getattr(pipe, 'unet', None)
+    if denoiser is None:
+        denoiser = getattr(pipe, 'transformer', None)
+    if denoiser is None:
+        logger.warning("Pipeline has no UNet or transformer to quantize, skipping quantization")
+        return
+    
+    # quantize_ only replaces nn.Linear weights by default, leaving
+    # normalization and softmax in full precision
+    if mode == "fp8":
+        quantize_(denoiser, Float8WeightOnlyConfig())
+    else:
+        quantize_(denoiser, Int8WeightOnlyConfig())
+    logger.info(f"Quantized {type(denoiser).__name__} weights to {mode}")
+
+
+def optimize_pipeline(pipe: DiffusionPipeline, device: str) -> DiffusionPipeline:
+    """Apply device-specific inference optimizations to a loaded pipeline"""
+    if device == "cuda":
+        # cuDNN's fp16 tensor-core convolutions prefer NHWC layout. Transformer
+        # based pipelines (e.g. DiT) have no UNet to convert.
+        if hasattr(pipe, 'unet'):
+            pipe.unet.to(memory_format=torch.channels_last)
+        if hasattr(pipe, 'vae'):
+            pipe.vae.to(memory_format=torch.channels_last)
+        
+        # Prefer xFormers' memory efficient attention. Without it diffusers
+        # already defaults to PyTorch's fused scaled_dot_product_attention.
+        try:
+            pipe.enable_xformers_memory_efficient_attention()
+            logger.info("Enabled xFormers memory efficient attention")
+        except Exception as e:
+            logger.info(f"xFormers attention unavailable ({e}), using PyTorch SDPA")
+        
+        # Quantize before compiling so the compiled graph uses the quantized kernels
+        if quantization:
+            quantize_denoiser(pipe, quantization)
+        
+        # Compile the UNet into fused kernels to cut per-step Python dispatch
+        # overhead. Compilation happens on the first call, see warmup_pipeline.
+        if compile_unet and hasattr(pipe, 'unet'):
+            pipe.unet = torch.compile(pipe.unet, mode="reduce-overhead", fullgraph=False, dynamic=False)
+            logger.info("Compiled UNet with torch.compile")
+    
+    # Attention slicing trades speed for memory, so only enable it when asked to
+    if low_vram and hasattr(pipe, 'enable_attention_slicing'):
+        pipe.enable_attention_slicing()
+        logger.info("Enabled attention slicing for low VRAM mode")
+    return pipe
+
+
 def load_model(model_path: str) -> DiffusionPipeline:
     """Load a diffusion model from the given path, DDUF file, or HuggingFace model ID"""
     global pipeline, current_model
     
-    if pipeline is not None and current_model == model_path:
-        logger.info(f"Model {model_path} already loaded")
+    # Serialize loads so concurrent callers never run from_pretrained twice
+    with model_lock:
+        if pipeline is not None and current_model == model_path:
+            logger.info(f"Model {model_path} already loaded")
+            return pipeline
+        
+        logger.info(f"Loading model: {model_path}")
+        
+        # Determine device
+        if torch.cuda.is_available():
+            device = "cuda"
+            dtype = torch.float16
+            logger.info("Using CUDA device with float16")
+            # Request sizes come from a small set of shapes, so let cuDNN pick the
+            # fastest convolution algorithm per shape, and allow TF32 on Ampere+
+            torch.backends.cudnn.benchmark = True
+            torch.backends.cuda.matmul.allow_tf32 = True
+            torch.backends.cudnn.allow_tf32 = True
+        elif torch.backends.mps.is_available():
+            device = "mps"
+            dtype = torch.float16
+            logger.info("Using MPS device (Apple Silicon) with float16")
+        else:
+            device = "cpu"
+            dtype = torch.float32
+            logger.info("Using CPU device with float32")
+        
+        # Check if this is a DDUF file
+        if is_dduf_file(model_path):
+            pipe = optimize_pipeline(load_model_from_dduf(model_path, device, dtype), device)
+            pipeline, current_model = pipe, model_path
+            return pipeline
+        
+        # Check if this is a directory containing a model
+        if os.path.isdir(model_path):
+            logger.info(f"Loading model from directory: {model_path}")
+        
+        try:
+            # Try to load using AutoPipelineForText2Image which handles most model types
+            pipe = from_pretrained_with_variant(
+                AutoPipelineForText2Image,
+                model_path,
+                dtype,
+                safety_checker=None,  # Disable safety checker for performance
+                requires_safety_checker=False,
+            )
+        except Exception as e:
+            logger.warning(f"AutoPipelineForText2Image failed: {e}, trying StableDiffusionPipeline")
+            try:
+                pipe = from_pretrained_with_variant(
+                    StableDiffusionPipeline,
+                    model_path,
+                    dtype,
+                    safety_checker=None,
+                    requires_safety_checker=False,
+                )
+            except Exception as e2:
+                logger.warning(f"StableDiffusionPipeline failed: {e2}, trying generic DiffusionPipeline")
+                pipe = from_pretrained_with_variant(
+                    DiffusionPipeline,
+                    model_path,
+                    dtype,
+                )
+        
+        # Only publish the pipeline once it is fully loaded and optimized
+        pipeline = optimize_pipeline(pipe.to(device), device)
+        current_model = model_path
+        logger.info(f"Model loaded successfully on {device}")
         return pipeline
+
+
+def warmup_pipeline():
+    """Run short dummy generations so the first request doesn't pay for compilation and autotuning.
     
-    logger.info(f"Loading model: {model_path}")
+    Failures are logged rather than raised: a server that can't warm up may
+    still be able to serve requests.
+    """
+    # cuDNN benchmark picks algorithms per input shape, so warm every size we
+    # expect to serve: the default plus any listed in DIFFUSERS_WARMUP_SIZES
+    sizes = [(512, 512)]
+    for size in os.environ.get("DIFFUSERS_WARMUP_SIZES", "").split(','):
+        if not size.strip():
+            continue
+        try:
+            parsed = parse_size(size.strip())
+        except ValueError as e:
+            logger.warning(f"Ignoring warmup size: {e}")
+            continue
+        if parsed not in sizes:
+            sizes.append(parsed)
+    
+    # Classifier-free guidance doubles the UNet batch, and the dispatcher
+    # produces every batch size up to MAX_BATCH_SIZE, so warm each of those
+    # shapes with the request default guidance scale. In low VRAM mode only
+    # single images are warmed to keep startup memory down.
+    max_batch_size = 1 if low_vram else MAX_BATCH_SIZE
+    for width, height in sizes:
+        logger.info(f"Warming up pipeline at {width}x{height}...")
+        start = time.time()
+        for batch_size in range(1, max_batch_size + 1):
+            try:
+                _, ready = run_pipeline(
+                    ["warmup"] * batch_size, [None] * batch_size, width, height,
+                    None, 2, 7.5,
+                )
+                if ready is not None:
+                    ready.synchronize()
+            except torch.cuda.OutOfMemoryError:
+                # Larger batches at this size won't fit either; requests fall
+                # back to per-image generation
+                logger.warning(f"Out of memory warming up a batch of {batch_size} at {width}x{height}, skipping larger batches")
+                torch.cuda.empty_cache()
+                break
+            except Exception as e:
+                logger.warning(f"Warmup failed at {width}x{height} with batch size {batch_size}: {e}")
+                break
+        logger.info(f"Pipeline warmed up at {width}x{height} in {time.time() - start:.1f}s")
+
+
+def get_generators(seeds: List[Optional[int]]) -> List[torch.Generator]:
+    """Return a cached random generator on the active device for each seed, reseeded with it.
     
-    # Determine device
+    Generators for None seeds are reseeded non-deterministically.
+    """
     if torch.cuda.is_available():
         device = "cuda"
-        dtype = torch.float16
-        logger.info("Using CUDA device with float16")
     elif torch.backends.mps.is_available():
         device = "mps"
-        dtype = torch.float16
-        logger.info("Using MPS device (Apple Silicon) with float16")
     else:
         device = "cpu"
-        dtype = torch.float32
-        logger.info("Using CPU device with float32")
     
-    # Check if this is a DDUF file
-    if is_dduf_file(model_path):
-        pipeline = load_model_from_dduf(model_path, device, dtype)
-        current_model = model_path
-        return pipeline
-    
-    # Check if this is a directory containing a model
-    if os.path.isdir(model_path):
-        logger.info(f"Loading model from directory: {model_path}")
+    # Reuse generators across requests rather than allocating new PRNG state
+    # on the device for every image
+    cached = generators.setdefault(device, [])
+    while len(cached) < len(seeds):
+        cached.append(torch.Generator(device=device))
+    for generator, seed in zip(cached, seeds):
+        if seed is None:
+            generator.seed()
+        else:
+            generator.manual_seed(seed)
+    return cached[:len(seeds)]
+
+
+def pipeline_output_type() -> str:
+    """Return the output_type to request from the loaded pipeline"""
+    # Only pipelines post-processing through a VaeImageProcessor return [0, 1]
+    # image tensors for "pt"; others (e.g. DeepFloyd IF returns [-1, 1]) go
+    # through PIL instead
+    if isinstance(getattr(pipeline, 'image_processor', None), VaeImageProcessor):
+        return "pt"
+    return "pil"
+
+
+def run_pipeline(
+    prompts: List[str],
+    seeds: List[Optional[int]],
+    width: int,
+    height: int,
+    negative_prompt: Optional[str],
+    num_inference_steps: int,
+    guidance_scale: float,
+) -> tuple[torch.Tensor, Optional[torch.cuda.Event]]:
+    """Run a single batched pipeline call producing one image per prompt.
     
-    try:
-        # Try to load using AutoPipelineForText2Image which handles most model types
-        pipeline = AutoPipelineForText2Image.from_pretrained(
-            model_path,
-            torch_dtype=dtype,
-            safety_checker=None,  # Disable safety checker for performance
-            requires_safety_checker=False,
+    Returns the images as a host uint8 tensor of shape (len(prompts), height, width, 3)
+    and, on CUDA, an event that is signalled once the tensor has been copied
+    from the device.
+    """
+    # The pipeline already runs in pure float16 on CUDA/MPS. Do not wrap this in
+    # torch.autocast: diffusers documents autocast with fp16 pipelines as slower
+    # and prone to producing black images.
+    #
+    # inference_mode is stronger than the no_grad diffusers applies internally:
+    # it also skips version counter and view tracking on every tensor.
+    with torch.inference_mode():
+        result = pipeline(
+            prompt=prompts,
+            negative_prompt=[negative_prompt] * len(prompts) if negative_prompt else None,
+            width=width,
+            height=height,
+            num_inference_steps=num_inference_steps,
+            guidance_scale=guidance_scale,
+            generator=get_generators(seeds) if any(seed is not None for seed in seeds) else None,
+            output_type=pipeline_output_type(),
         )
-    except Exception as e:
-        logger.warning(f"AutoPipelineForText2Image failed: {e}, trying StableDiffusionPipeline")
-        try:
-            pipeline = StableDiffusionPipeline.from_pretrained(
-                model_path,
-                torch_dtype=dtype,
-                safety_checker=None,
-                requires_safety_checker=False,
-            )
-        except Exception as e2:
-            logger.warning(f"StableDiffusionPipeline failed: {e2}, trying generic DiffusionPipeline")
-            pipeline = DiffusionPipeline.from_pretrained(
-                model_path,
-                torch_dtype=dtype,
-            )
-    
-    pipeline = pipeline.to(device)
-    
-    # Enable memory efficient attention if available
-    if hasattr(pipeline, 'enable_attention_slicing'):
-        pipeline.enable_attention_slicing()
+        
+        if not isinstance(result.images, torch.Tensor):
+            # The pipeline ignored output_type and returned PIL images
+            pixels = np.stack([np.asarray(image.convert("RGB")) for image in result.images])
+            return torch.from_numpy(pixels), None
+        
+        # Quantize on the device so only uint8 pixels cross the bus
+        images = (result.images * 255).round().clamp(0, 255).to(torch.uint8).permute(0, 2, 3, 1).contiguous()
+    if not images.is_cuda:
+        return images.cpu(), None
     
-    current_model = model_path
-    logger.info(f"Model loaded successfully on {device}")
-    return pipeline
+    # Copy asynchronously into pinned host memory so the next pipeline call can
+    # be queued while the transfer completes. Pinned allocations are served from
+    # PyTorch's caching host allocator, so this does not re-pin on each call.
+    host_images = torch.empty(images.shape, dtype=torch.uint8, pin_memory=True)
+    host_images.copy_(images, non_blocking=True)
+    ready = torch.cuda.Event()
+    ready.record()
+    return host_images, ready
+
+
+def encode_image(image: torch.Tensor, ready: Optional[torch.cuda.Event] = None) -> bytes:
+    """Encode a host uint8 HWC image tensor in the configured IMAGE_FORMAT"""
+    if ready is not None:
+        ready.synchronize()
+    if IMAGE_FORMAT == "PNG" and encode_png is not None:
+        # libpng straight from the tensor, skipping the PIL round-trip
+        return encode_png(image.permute(2, 0, 1).contiguous(), compression_level=1).numpy().tobytes()
+    # Each encode worker reuses its own buffer rather than allocating one per image
+    buffer = getattr(encode_buffers, 'buffer', None)
+    if buffer is None:
+        buffer = encode_buffers.buffer = io.BytesIO()
+    buffer.seek(0)
+    buffer.truncate(0)
+    Image.fromarray(image.numpy()).save(buffer, format=IMAGE_FORMAT, **IMAGE_SAVE_OPTIONS[IMAGE_FORMAT])
+    return buffer.getvalue()
 
 
 def generate_images(
-    prompt: str,
-    n: int = 1,
+    prompts: List[str],
+    seeds: List[Optional[int]],
     width: int = 512,
     height: int = 512,
     negative_prompt: Optional[str] = None,
     num_inference_steps: int = 50,
     guidance_scale: float = 7.5,
-    seed: Optional[int] = None,
-) -> List[bytes]:
-    """Generate images using the loaded pipeline"""
+    on_images: Optional[Callable[[List[Future]], None]] = None,
+) -> List[Future]:
+    """Generate one image per prompt using the loaded pipeline.
+    
+    Returns a future per image that resolves to its encoded bytes. If given,
+    on_images is called with each group of futures as soon as it is submitted
+    for encoding, so callers can stream images before the whole set is done.
+    """
     global pipeline
     
     if pipeline is None:
         raise RuntimeError("No model loaded")
     
-    # Set seed for reproducibility
-    generator = None
-    if seed is not None:
-        if torch.cuda.is_available():
-            generator = torch.Generator(device="cuda").manual_seed(seed)
-        elif torch.backends.mps.is_available():
-            generator = torch.Generator(device="mps").manual_seed(seed)
-        else:
-            generator = torch.Generator().manual_seed(seed)
+    n = len(prompts)
+    logger.info(f"Generating {n} image(s) with prompt: {prompts[0][:100]}...")
     
-    logger.info(f"Generating {n} image(s) with prompt: {prompt[:100]}...")
+    # Generate images in batches so the denoising loop runs once per batch
+    # rather than once per image.
+    #
+    # Image compression releases the GIL, so each batch is handed to the encode
+    # pool as soon as it is ready and encodes while the next batch generates.
+    futures = []
+    for start in range(0, n, MAX_BATCH_SIZE):
+        end = min(start + MAX_BATCH_SIZE, n)
+        try:
+            batch, ready = run_pipeline(
+                prompts[start:end], seeds[start:end], width, height,
+                negative_prompt, num_inference_steps, guidance_scale,
+            )
+        except torch.cuda.OutOfMemoryError:
+            if end - start == 1:
+                raise
+            logger.warning(f"Out of memory generating a batch of {end - start} images, falling back to sequential generation")
+            torch.cuda.empty_cache()
+            for i in range(start, end):
+                batch, ready = run_pipeline(
+                    prompts[i:i + 1], seeds[i:i + 1], width, height,
+                    negative_prompt, num_inference_steps, guidance_scale,
+                )
+                submitted = [encode_pool.submit(encode_image, batch[0], ready)]
+                futures.extend(submitted)
+                if on_images is not None:
+                    on_images(submitted)
+            continue
+        
+        submitted = [encode_pool.submit(encode_image, image, ready) for image in batch]
+        futures.extend(submitted)
+        if on_images is not None:
+            on_images(submitted)
     
-    # Generate images
-    images = []
-    for i in range(n):
-        # If we have a seed, increment it for each image to get different but reproducible results
-        current_generator = None
-        if generator is not None and seed is not None:
-            if torch.cuda.is_available():
-                current_generator = torch.Generator(device="cuda").manual_seed(seed + i)
-            elif torch.backends.mps.is_available():
-                current_generator = torch.Generator(device="mps").manual_seed(seed + i)
-            else:
-                current_generator = torch.Generator().manual_seed(seed + i)
+    logger.info(f"Generated {len(futures)} image(s)")
+    return futures
+
+
+@dataclass
+class GenerationJob:
+    """A queued image generation request awaiting a batch"""
+    prompt: str
+    n: int
+    seed: Optional[int]
+    # Parameters that must match for jobs to share a pipeline call
+    params: dict
+    # Receives the encode future of each image in order, or the exception
+    # that failed the batch
+    images: asyncio.Queue = field(default_factory=asyncio.Queue)
+    # Set once the requester stops waiting for images
+    closed: bool = False
+
+
+def deliver_images(owners: Iterator[GenerationJob], futures: List[Future]):
+    """Hand each encode future to the job that requested its image"""
+    for future in futures:
+        next(owners).images.put_nowait(future)
+
+
+async def job_images(job: GenerationJob) -> AsyncIterator[bytes]:
+    """Yield the encoded images of a queued job in order as they complete"""
+    try:
+        for _ in range(job.n):
+            item = await job.images.get()
+            if isinstance(item, Exception):
+                raise item
+            yield await asyncio.wrap_future(item)
+    finally:
+        job.closed = True
+
+
+async def batch_dispatcher():
+    """Group queued generation jobs with matching parameters into shared pipeline calls"""
+    loop = asyncio.get_running_loop()
+    pending: List[GenerationJob] = []
+    while True:
+        if not pending:
+            pending.append(await generation_queue.get())
+            # Give concurrent requests a short window to join the batch
+            await asyncio.sleep(BATCH_WINDOW)
+        while not generation_queue.empty():
+            pending.append(generation_queue.get_nowait())
         
-        result = pipeline(
-            prompt=prompt,
-            negative_prompt=negative_prompt,
-            width=width,
-            height=height,
-            num_inference_steps=num_inference_steps,
-            guidance_scale=guidance_scale,
-            generator=current_generator,
-        )
+        # Drop jobs whose client went away while they were queued
+        pending = [job for job in pending if not job.closed]
+        if not pending:
+            continue
         
-        image = result.images[0]
+        # Batch the oldest job with any others sharing its parameters, up to
+        # MAX_BATCH_SIZE images. A larger job runs alone and is split by
+        # generate_images.
+        batch = [pending.pop(0)]
+        total = batch[0].n
+        for job in list(pending):
+            if job.params == batch[0].params and total + job.n <= MAX_BATCH_SIZE:
+                pending.remove(job)
+                batch.append(job)
+                total += job.n
         
-        # Convert to PNG bytes
-        buffer = io.BytesIO()
-        image.save(buffer, format="PNG")
-        images.append(buffer.getvalue())
-    
-    logger.info(f"Generated {len(images)} image(s)")
-    return images
+        # If a seed is given, image i of a job uses seed + i to get different
+        # but reproducible results
+        prompts, seeds = [], []
+        for job in batch:
+            prompts.extend([job.prompt] * job.n)
+            seeds.extend(job.seed + i if job.seed is not None else None for i in range(job.n))
+        
+        # Images are handed back to their jobs from the worker thread as each
+        # pipeline call finishes rather than when the whole batch is done
+        owners = iter([job for job in batch for _ in range(job.n)])
+        on_images = functools.partial(loop.call_soon_threadsafe, deliver_images, owners)
+        try:
+            await loop.run_in_executor(
+                generation_executor,
+                functools.partial(generate_images, prompts, seeds, on_images=on_images, **batch[0].params),
+            )
+        except Exception as e:
+            for job in batch:
+                job.images.put_nowait(e)
+
+
+def b64_encode(image_bytes: bytes) -> str:
+    """Base64 encode an image for a b64_json response field"""
+    # base64 output is pure ASCII, so decode as such to skip UTF-8 validation
+    return base64.b64encode(image_bytes).decode("ascii")
 
 
 @app.get("/health")
@@ -269,8 +662,12 @@ async def list_models():
 
 
 @app.post("/v1/images/generations", response_model=ImageGenerationResponse)
-async def create_image(request: ImageGenerationRequest):
-    """Generate images from a prompt (OpenAI Images API compatible)"""
+async def create_image(request: ImageGenerationRequest, stream: bool = False):
+    """Generate images from a prompt (OpenAI Images API compatible).
+    
+    With ?stream=true the images are returned as newline-delimited JSON, one
+    ImageData object per line, each written as soon as it is ready.
+    """
     global pipeline
     
     # Check if the requested model matches
@@ -284,34 +681,51 @@ async def create_image(request: ImageGenerationRequest):
     if pipeline is None:
         raise HTTPException(status_code=503, detail="No model loaded. Server is not ready.")
     
+    if request.response_format != "b64_json":
+        # URL format not supported in this implementation
+        raise HTTPException(
+            status_code=400,
+            detail="URL response format is not supported. Use 'b64_json' instead."
+        )
+    
+    loop = asyncio.get_running_loop()
     try:
         # Parse size
         width, height = parse_size(request.size)
         
-        # Generate images
-        image_bytes_list = generate_images(
+        # Queue the request for the batch dispatcher, which generates images on
+        # a worker thread so the event loop keeps serving health checks and
+        # other requests during generation
+        job = GenerationJob(
             prompt=request.prompt,
             n=request.n,
-            width=width,
-            height=height,
-            negative_prompt=request.negative_prompt,
-            num_inference_steps=request.num_inference_steps,
-            guidance_scale=request.guidance_scale,
             seed=request.seed,
+            params=dict(
+                width=width,
+                height=height,
+                negative_prompt=request.negative_prompt,
+                num_inference_steps=request.num_inference_steps,
+                guidance_scale=request.guidance_scale,
+            ),
         )
+        await generation_queue.put(job)
+        images = job_images(job)
         
-        # Format response
-        data = []
-        for img_bytes in image_bytes_list:
-            if request.response_format == "b64_json":
-                b64_str = base64.b64encode(img_bytes).decode("utf-8")
-                data.append(ImageData(b64_json=b64_str))
-            else:
-                # URL format not supported in this implementation
-                raise HTTPException(
-                    status_code=400,
-                    detail="URL response format is not supported. Use 'b64_json' instead."
-                )
+        if stream:
+            # Wait for the first image before responding so generation errors
+            # still map to an HTTP status
+            first = await images.__anext__()
+            return StreamingResponse(
+                stream_images(first, images),
+                media_type="application/x-ndjson",
+            )
+        
+        # Format response, base64 encoding on the encode pool
+        image_bytes_list = [image_bytes async for image_bytes in images]
+        b64_strs = await asyncio.gather(*(
+            loop.run_in_executor(encode_pool, b64_encode, image_bytes) for image_bytes in image_bytes_list
+        ))
+        data = [ImageData(b64_json=b64_str) for b64_str in b64_strs]
         
         return ImageGenerationResponse(
             created=int(time.time()),
@@ -325,12 +739,34 @@ async def create_image(request: ImageGenerationRequest):
         raise HTTPException(status_code=500, detail=f"Image generation failed: {str(e)}")
 
 
+async def stream_images(first: bytes, rest: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Write images as newline-delimited ImageData JSON objects"""
+    loop = asyncio.get_running_loop()
+    try:
+        yield ImageData(b64_json=await loop.run_in_executor(encode_pool, b64_encode, first)).model_dump_json() + "\n"
+        async for image_bytes in rest:
+            yield ImageData(b64_json=await loop.run_in_executor(encode_pool, b64_encode, image_bytes)).model_dump_json() + "\n"
+    except Exception as e:
+        # The status line has already been sent, so report the failure in-band
+        logger.exception("Error generating image")
+        yield json.dumps({"error": {"message": f"Image generation failed: {str(e)}"}}) + "\n"
+    finally:
+        await rest.aclose()
+
+
 @app.on_event("startup")
 async def startup_event():
     """Startup event handler"""
     logger.info("Diffusers server starting up...")
     if current_model:
         logger.info(f"Model path: {current_model}")
+    # Warming up on CPU would only delay startup, there is nothing to compile or tune
+    if pipeline is not None and pipeline.device.type != "cpu":
+        await asyncio.get_running_loop().run_in_executor(generation_executor, warmup_pipeline)
+    
+    global generation_queue, dispatcher_task
+    generation_queue = asyncio.Queue()
+    dispatcher_task = asyncio.create_task(batch_dispatcher())
 
 
 def main():
@@ -340,13 +776,25 @@ def main():
     parser.add_argument("--host", type=str, default="0.0.0.0", help="Host to bind to")
     parser.add_argument("--port", type=int, default=8000, help="Port to bind to")
     parser.add_argument("--served-model-name", type=str, default=None, help="Name to serve the model as")
+    parser.add_argument("--low-vram", action="store_true", help="Enable attention slicing to reduce VRAM usage at the cost of speed")
+    parser.add_argument("--compile", action="store_true", help="Compile the UNet with torch.compile on CUDA (slows startup while kernels compile)")
+    parser.add_argument("--quantize", type=str, choices=["int8", "fp8"], default=None, help="Quantize UNet/transformer weights on CUDA (requires torchao; fp8 needs Ada/Hopper GPUs)")
     
     args = parser.parse_args()
     
-    global served_model_name
+    global served_model_name, low_vram, compile_unet, quantization
     served_model_name = args.served_model_name or args.model_path
+    low_vram = args.low_vram
+    compile_unet = args.compile
+    quantization = args.quantize
+    
+    # Persist compiled kernels across server restarts
+    os.environ.setdefault("TORCHINDUCTOR_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "diffusers-server", "inductor"))
     
     try:
+        if IMAGE_FORMAT not in IMAGE_SAVE_OPTIONS:
+            raise ValueError(f"Unsupported DIFFUSERS_IMAGE_FORMAT '{IMAGE_FORMAT}'. Expected one of: {', '.join(IMAGE_SAVE_OPTIONS)}")
+        
         # Load the model at startup
         load_model(args.model_path)
         